@@ -1,78 +1,240 @@
 import re
 import sys
+import time
+import functools
+import hashlib
+import logging
+import tempfile
+import threading
 from dotenv import load_dotenv
 import os
-from typing import List, Optional, Dict, Any, Tuple
+from typing import Callable, Iterable, List, NamedTuple, Optional, Dict, Any, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 from importlib import resources
 import argparse
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 
-TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemini-2.5-flash-lite")
+from bt_rename import __version__
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def query_tmdb(title: str) -> Optional[Tuple[str, Dict[str, Any]]]:
-    assert TMDB_API_KEY, "TMDB_API_KEY is not set"
 
+log = logging.getLogger("bt_rename")
+
+
+class _Env(NamedTuple):
+    tmdb_api_key: Optional[str]
+    openrouter_api_key: str
+    openrouter_model: str
+
+
+@functools.cache
+def _env() -> _Env:
+    # read lazily so .env values are seen, and skip parsing .env when the keys are already exported
+    if "TMDB_API_KEY" not in os.environ or "OPENROUTER_API_KEY" not in os.environ:
+        load_dotenv()
+    return _Env(
+        tmdb_api_key=os.getenv("TMDB_API_KEY"),
+        openrouter_api_key=os.getenv("OPENROUTER_API_KEY", ""),
+        openrouter_model=os.getenv("OPENROUTER_MODEL", "google/gemini-2.5-flash-lite"),
+    )
+
+
+TMDB_LANGUAGE = "zh-CN"
+TMDB_CACHE_TTL = 7 * 24 * 60 * 60
+RENAME_WORKERS = 16
+SUBTITLE_EXTENSIONS = frozenset({'srt', 'ass', 'ssa', 'vtt', 'sub', 'idx', 'sup'})
+VIDEO_EXTENSIONS = frozenset({'mp4', 'mkv', 'avi', 'mov', 'wmv'})
+CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "bt_rename")
+
+_TAG_RE = re.compile(r'\[.*?\]|\(.*?\)')
+# a path component starting with '.' that is not '.' or '..' itself
+_HIDDEN_RE = re.compile(rf'(?:^|{re.escape(os.sep)})\.(?!\.?(?:{re.escape(os.sep)}|$))')
+
+
+def _json_loads(data: str | bytes) -> Any:
+    # callers only catch json.JSONDecodeError: orjson's error subclasses it, and invalid UTF-8 is
+    # re-raised as one here since the stdlib decoder would raise UnicodeDecodeError instead
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        try:
+            data = data.decode()
+        except UnicodeDecodeError as e:
+            raise json.JSONDecodeError(f"Invalid UTF-8: {e.reason}", data.decode(errors="replace"), e.start) from e
+    return json.loads(data)
+
+
+def _json_dumps(data: Any, indent: bool = False) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else None)
+    if indent:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode()
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def _build_session(retry: Retry) -> requests.Session:
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+    session.headers.update({
+        "User-Agent": f"bt-rename/{__version__}",
+        "Accept-Encoding": "gzip",
+    })
+    return session
+
+
+# keep-alive sessions, one per API so each gets its own retry policy
+_TMDB_SESSION = _build_session(
+    Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]))
+# only retry POST when the completion can't have started: connect failures and 429s.
+# a read error may come after the request was accepted, so resending it could bill twice
+_OPENROUTER_SESSION = _build_session(
+    Retry(total=3, connect=3, read=False, other=0, status=3, status_forcelist=[429],
+          allowed_methods=None, backoff_factor=0.5))
+
+
+def _warm_up_connection(session: requests.Session, url: str) -> None:
     try:
-        tv_search_url = f"https://api.themoviedb.org/3/search/tv"
-        params: Dict[str, str] = {
-            "api_key": TMDB_API_KEY,
-            "query": title,
-            "language": "zh-CN"
-        }
+        session.head(url, timeout=5)
+    except requests.exceptions.RequestException:
+        pass
 
-        response = requests.get(tv_search_url, params=params, timeout=10)
-        response.raise_for_status()
-        results = response.json().get("results")
 
-        if results:
-            best_match = results[0]
-            tv_id = best_match["id"]
+def _submit_daemon(fn: Callable[..., Any], *args: Any) -> Future:
+    # unlike ThreadPoolExecutor workers, daemon threads aren't joined at interpreter exit,
+    # so a request whose result is no longer needed can't hold up the process
+    future: Future = Future()
 
-            details_url = f"https://api.themoviedb.org/3/tv/{tv_id}"
-            details_response = requests.get(
-                details_url, params={"api_key": TMDB_API_KEY, "language": "zh-CN"}, timeout=10)
-            details_response.raise_for_status()
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
 
-            return "TV", details_response.json()
+    threading.Thread(target=run, daemon=True).start()
+    return future
 
-        movie_search_url = f"https://api.themoviedb.org/3/search/movie"
-        response = requests.get(movie_search_url, params=params, timeout=10)
-        response.raise_for_status()
-        results = response.json().get("results")
 
-        if results:
-            best_match = results[0]
-            movie_id = best_match["id"]
+def _warm_up_connections() -> None:
+    # open pooled connections (DNS + TLS) to both hosts in parallel, ahead of the first real request.
+    # nothing waits on them: a request that starts first simply opens its own connection
+    for session, url in ((_TMDB_SESSION, "https://api.themoviedb.org/3/"),
+                         (_OPENROUTER_SESSION, "https://openrouter.ai/api/v1/")):
+        _submit_daemon(_warm_up_connection, session, url)
 
-            details_url = f"https://api.themoviedb.org/3/movie/{movie_id}"
-            details_response = requests.get(
-                details_url, params={"api_key": TMDB_API_KEY, "language": "zh-CN"}, timeout=10)
-            details_response.raise_for_status()
 
-            return "MOVIE", details_response.json()
+def _search_tmdb(kind: str, params: Dict[str, str]) -> List[Dict[str, Any]]:
+    response = _TMDB_SESSION.get(f"https://api.themoviedb.org/3/search/{kind}", params=params, timeout=10)
+    response.raise_for_status()
+    return _json_loads(response.content).get("results") or []
 
-        return None
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error querying TMDB: {e}", file=sys.stderr)
+def _read_cache(name: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(CACHE_DIR, name), "rb") as f:
+            data = _json_loads(f.read())
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_cache(name: str, data: Dict[str, Any]) -> None:
+    path = os.path.join(CACHE_DIR, name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a private temp file per writer, since several socket-activated instances may run at once
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_json_dumps(data))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        log.warning("Failed to write cache %s: %s", path, e)
+
+
+def query_tmdb(title: str, use_cache: bool = True) -> Optional[Tuple[str, Dict[str, Any]]]:
+    assert _env().tmdb_api_key, "TMDB_API_KEY is not set"
+
+    now = time.time()
+    cache = {k: v for k, v in _read_cache("tmdb.json").items()
+             if isinstance(v, dict) and isinstance(v.get("ts"), (int, float)) and now - v["ts"] < TMDB_CACHE_TTL}
+    updated = False
+
+    try:
+        # entries of the wrong shape (hand-edited or foreign files) count as misses
+        search_key = f"search:{title}:{TMDB_LANGUAGE}"
+        search = cache.get(search_key) if use_cache else None
+        if search and search.get("media_type") in ("TV", "MOVIE") and isinstance(search.get("id"), int):
+            media_type, tmdb_id = search["media_type"], search["id"]
+        elif match := _search_tmdb_best_match(title):
+            media_type, tmdb_id = match
+            cache[search_key] = {"ts": now, "media_type": media_type, "id": tmdb_id}
+            updated = True
+        else:
+            return None
+
+        # different titles often resolve to the same show, so details are cached by id
+        details_key = f"{media_type.lower()}/{tmdb_id}:{TMDB_LANGUAGE}"
+        cached_details = cache.get(details_key, {}).get("details") if use_cache else None
+        if isinstance(cached_details, dict):
+            details = cached_details
+        else:
+            details = _fetch_tmdb_details(media_type.lower(), tmdb_id)
+            cache[details_key] = {"ts": now, "details": details}
+            updated = True
+
+    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        log.error("Error querying TMDB: %s", e)
         return None
 
+    if updated:
+        _write_cache("tmdb.json", cache)
 
-def extract_anime_name(dir_name: str) -> str:
-    import re
+    return media_type, details
 
-    # remove tags in square brackets and parentheses
-    name = re.sub(r'\[.*?\]', '', dir_name).strip()
-    name = re.sub(r'\(.*?\)', '', name).strip()
 
-    # remove extra spaces
-    name = re.sub(r'\s+', ' ', name).strip()
+@functools.lru_cache(maxsize=256)
+def _search_tmdb_best_match(title: str) -> Optional[Tuple[str, int]]:
+    params: Dict[str, str] = {
+        "api_key": _env().tmdb_api_key,
+        "query": title,
+        "language": TMDB_LANGUAGE
+    }
+
+    # search both kinds at once so the movie fallback doesn't cost an extra round trip;
+    # a TV hit goes straight to the details call and the movie search is simply abandoned
+    tv_future = _submit_daemon(_search_tmdb, "tv", params)
+    movie_future = _submit_daemon(_search_tmdb, "movie", params)
 
-    return name
+    if tv_results := tv_future.result():
+        return "TV", tv_results[0]["id"]
+    if movie_results := movie_future.result():
+        return "MOVIE", movie_results[0]["id"]
+    return None
+
+
+@functools.lru_cache(maxsize=256)
+def _fetch_tmdb_details(kind: str, tmdb_id: int) -> Dict[str, Any]:
+    response = _TMDB_SESSION.get(f"https://api.themoviedb.org/3/{kind}/{tmdb_id}",
+                                 params={"api_key": _env().tmdb_api_key, "language": TMDB_LANGUAGE}, timeout=10)
+    response.raise_for_status()
+    return _json_loads(response.content)
+
+
+def extract_anime_name(dir_name: str) -> str:
+    # remove tags in square brackets and parentheses, then collapse extra spaces
+    return ' '.join(_TAG_RE.sub('', dir_name).split())
 
 
 def simplify_tmdb_result(media_type: str, result: Dict[str, Any]) -> Dict[str, Any]:
@@ -101,108 +263,127 @@ def simplify_tmdb_result(media_type: str, result: Dict[str, Any]) -> Dict[str, A
 
 def normalize_rename_response(paths: List[str], rename_response: str) -> Optional[Dict[str, str]]:
     if not rename_response or not rename_response.strip():
-        print("Empty rename response received.", file=sys.stderr)
+        log.error("Empty rename response received.")
         return None
 
-    if rename_response.startswith("```json") and rename_response.endswith("```"):
-        rename_response = rename_response[len("```json"): -len("```")].strip()
+    rename_response = rename_response.removeprefix("```json").removesuffix("```").strip()
 
     try:
-        response_json = json.loads(rename_response)
+        response_json = _json_loads(rename_response)
     except json.JSONDecodeError as e:
-        print(f"Failed to parse JSON response: {e}", file=sys.stderr)
-        print(f"Raw response: {rename_response}", file=sys.stderr)
+        log.error("Failed to parse JSON response: %s", e)
+        log.error("Raw response: %s", rename_response)
         return None
 
     if 'result' not in response_json:
-        print("No 'result' field in rename response JSON.", file=sys.stderr)
+        log.error("No 'result' field in rename response JSON.")
         return None
 
     result: List[str] = response_json['result']
 
     if len(result) != len(paths):
-        print("Mismatch between number of paths and rename results.", file=sys.stderr)
-        print(f"Paths: {paths}", file=sys.stderr)
-        print(f"Results: {result}", file=sys.stderr)
+        log.error("Mismatch between number of paths and rename results.")
+        log.error("Paths: %s", paths)
+        log.error("Results: %s", result)
         return None
 
-    return {original: new for original, new in zip(paths, result)}
+    return dict(zip(paths, result))
 
 
 def generate_rename_response(paths: List[str], tmdb_info: Optional[Dict[str, Any]], prompt: str) -> Optional[str]:
-    assert OPENROUTER_API_KEY, "OPENROUTER_API_KEY is not set"
-    assert OPENROUTER_MODEL, "OPENROUTER_MODEL is not set"
+    env = _env()
+    assert env.openrouter_api_key, "OPENROUTER_API_KEY is not set"
+    assert env.openrouter_model, "OPENROUTER_MODEL is not set"
 
     full_prompt = prompt.replace("<<FILES>>", '\n'.join(paths))
 
     if tmdb_info:
-        full_prompt = full_prompt.replace("<<TMDB_INFO>>", str(tmdb_info))
+        full_prompt = full_prompt.replace("<<TMDB_INFO>>", _json_dumps(tmdb_info).decode())
 
     headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Authorization": f"Bearer {env.openrouter_api_key}",
         "Content-Type": "application/json"
     }
     data: Dict[str, Any] = {
-        "model": OPENROUTER_MODEL,
+        "model": env.openrouter_model,
         "messages": [{"role": "user", "content": full_prompt}],
-        "temperature": 0.2
+        "temperature": 0.2,
+        "stream": True
     }
 
     try:
-        response = requests.post("https://openrouter.ai/api/v1/chat/completions",
-                                 headers=headers, json=data, timeout=30)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"].strip()
+        with _OPENROUTER_SESSION.post("https://openrouter.ai/api/v1/chat/completions",
+                                      headers=headers, json=data, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            return _read_completion_stream(response)
     except requests.exceptions.RequestException as e:
-        print(f"Error querying OpenRouter: {e}, headers: {headers}, data: {data}", file=sys.stderr)
+        log.error("Error querying OpenRouter: %s, headers: %s, data: %s", e, headers, data)
         return None
 
 
+def _read_completion_stream(response: requests.Response) -> Optional[str]:
+    # server-sent events: "data:{chunk}" lines, ": ..." keep-alive comments, then "data: [DONE]"
+    parts: List[str] = []
+    for line in response.iter_lines():
+        if not line.startswith(b"data:"):
+            continue
+
+        # the space after the field name is optional in SSE
+        payload = line[len(b"data:"):].removeprefix(b" ")
+        if payload == b"[DONE]":
+            break
+
+        try:
+            chunk = _json_loads(payload)
+        except json.JSONDecodeError as e:
+            log.error("Failed to parse stream chunk: %s", e)
+            return None
+
+        if "error" in chunk:
+            log.error("Error from OpenRouter: %s", chunk['error'])
+            return None
+
+        if choices := chunk.get("choices"):
+            parts.append(choices[0].get("delta", {}).get("content") or "")
+
+    return "".join(parts).strip()
+
+
 def diff_rename_files(rename_map: Dict[str, str]) -> None:
     for original, new in rename_map.items():
         print(f"'{original}' -> '{new}'")
 
 
-def filter_hidden_paths(paths: List[str]) -> List[str]:
-    filtered_paths: List[str] = []
-    for path in paths:
-        if not path.strip():
-            continue
+def filter_hidden_paths(paths: Iterable[str]) -> List[str]:
+    return [path for path in paths if path.strip() and not _HIDDEN_RE.search(path)]
+
 
-        path_parts = path.split(os.sep)
-        has_hidden = any(part.startswith('.') and part not in ['.', '..'] for part in path_parts)
-        if not has_hidden:
-            filtered_paths.append(path)
-    return filtered_paths
+def _extension(path: str) -> str:
+    # lowercase only the extension instead of a copy of the whole path
+    _, dot, ext = path.rpartition('.')
+    return ext.lower() if dot and os.sep not in ext else ''
 
 
 def has_subtitle_files(paths: List[str]) -> bool:
     # FIXME: different folders will be ignored
-    subtitle_extensions = {'.srt', '.ass', '.ssa', '.vtt', '.sub', '.idx', '.sup'}
-
-    for path in paths:
-        _, ext = os.path.splitext(path.lower())
-        if ext in subtitle_extensions:
-            return True
-
-    return False
+    return any(_extension(path) in SUBTITLE_EXTENSIONS for path in paths)
 
 
 def has_video_files(paths: List[str]) -> bool:
-    video_extensions = {'.mp4', '.mkv', '.avi', '.mov', '.wmv'}
-
-    for path in paths:
-        _, ext = os.path.splitext(path.lower())
-        if ext in video_extensions:
-            return True
-
-    return False
+    return any(_extension(path) in VIDEO_EXTENSIONS for path in paths)
 
 
 def common_top_directory(paths: List[str]) -> str:
     if not paths:
         return ''
 
+    # fast path: every path lives under the same first component (a single torrent root)
+    root, sep, _ = paths[0].partition(os.sep)
+    if sep and root != os.curdir:
+        prefix = root + os.sep
+        if all(path.startswith(prefix) for path in paths):
+            return root
+
     dirs = [os.path.dirname(path) for path in paths]
     common_path = os.path.commonpath(dirs)
 
@@ -213,69 +394,149 @@ def common_top_directory(paths: List[str]) -> str:
     return common_path
 
 
-def execute_rename_plan(rename_map: Dict[str, str]) -> None:
-    for original, new in rename_map.items():
-        absolute_original = os.path.abspath(original)
-        absolute_new = os.path.abspath(new)
+def execute_rename_plan(rename_map: Dict[str, str], max_workers: int = RENAME_WORKERS) -> None:
+    cwd = os.getcwd()
 
-        new_dir = os.path.dirname(absolute_new)
-        if not os.path.exists(new_dir):
-            os.makedirs(new_dir)
+    # same as os.path.abspath, without a getcwd() call per path
+    def _abs(path: str) -> str:
+        return os.path.normpath(os.path.join(cwd, path))
 
-        os.rename(absolute_original, absolute_new)
-        print(f"Renamed '{absolute_original}' to '{absolute_new}'", file=sys.stderr)
+    abs_pairs = [(_abs(original), _abs(new)) for original, new in rename_map.items()]
 
+    # one stat per unique directory; makedirs(exist_ok=True) alone would stat, mkdir and stat again
+    for new_dir in {os.path.dirname(absolute_new) for _, absolute_new in abs_pairs}:
+        if not os.path.isdir(new_dir):
+            os.makedirs(new_dir, exist_ok=True)
 
-def generate_rename_plan(terms: str, paths: List[str]) -> Optional[Dict[str, str]]:
+    # renames are independent and release the GIL, which pays off on network filesystems
+    errors: List[OSError] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(abs_pairs)))) as executor:
+        futures = {executor.submit(os.rename, *pair): pair for pair in abs_pairs}
+        for future in as_completed(futures):
+            absolute_original, absolute_new = futures[future]
+            try:
+                future.result()
+            except OSError as e:
+                log.error("Failed to rename '%s' to '%s': %s", absolute_original, absolute_new, e)
+                errors.append(e)
+            else:
+                log.info("Renamed '%s' to '%s'", absolute_original, absolute_new)
+
+    if errors:
+        raise errors[0]
+
+
+@functools.cache
+def _load_prompt() -> str:
+    return resources.files('bt_rename').joinpath('rename_plan_prompt.txt').read_text(encoding='utf-8')
+
+
+def _plan_cache_name(terms: str, paths: List[str]) -> str:
+    key = '\n'.join([_env().openrouter_model, terms, *sorted(paths)])
+    return os.path.join("plans", f"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.json")
+
+
+def _load_cached_plan(cache_name: str, paths: List[str]) -> Optional[Dict[str, str]]:
+    # a plan is stale once any input path was touched after it was cached
     try:
-        prompt_resource = resources.files('bt_rename').joinpath('rename_plan_prompt.txt')
-        prompt = prompt_resource.read_text()
+        cached_at = os.path.getmtime(os.path.join(CACHE_DIR, cache_name))
+        if any(os.path.getmtime(path) > cached_at for path in paths):
+            return None
+    except OSError:
+        return None
+
+    plan = _read_cache(cache_name)
+    if not all(isinstance(new, str) for new in plan.values()) or plan.keys() != set(paths):
+        return None
+    return plan
+
+
+def _prune_cached_plans() -> None:
+    # plans are keyed by their input paths, which stop existing once renamed, so nothing else removes them
+    expires = time.time() - TMDB_CACHE_TTL
+    try:
+        with os.scandir(os.path.join(CACHE_DIR, "plans")) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < expires:
+                    os.unlink(entry.path)
+    except OSError as e:
+        log.warning("Failed to prune cached plans: %s", e)
+
+
+def save_rename_plan(terms: str, paths: List[str], rename_plan: Dict[str, str]) -> None:
+    # only called for an accepted plan that wasn't executed, so a rejected plan is never served
+    # from the cache and an executed one (whose inputs are gone) never lingers there
+    _prune_cached_plans()
+    _write_cache(_plan_cache_name(terms, paths), rename_plan)
+
+
+def discard_rename_plan(terms: str, paths: List[str]) -> None:
+    try:
+        os.unlink(os.path.join(CACHE_DIR, _plan_cache_name(terms, paths)))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        log.warning("Failed to remove cached plan: %s", e)
+
+
+def generate_rename_plan(terms: str, paths: List[str], use_cache: bool = True) -> Optional[Dict[str, str]]:
+    if use_cache and (cached_plan := _load_cached_plan(_plan_cache_name(terms, paths), paths)):
+        log.info("Using cached rename plan.")
+        return cached_plan
+
+    try:
+        prompt = _load_prompt()
     except Exception as e:
-        print(f"Error loading prompt file: {e}")
+        log.error("Error loading prompt file: %s", e)
         return None
 
     tmdb_info: Optional[Dict[str, Any]] = None
-    if tmdb_result := query_tmdb(terms):
+    if tmdb_result := query_tmdb(terms, use_cache):
         tmdb_info = simplify_tmdb_result(*tmdb_result)
-        print("Queried TMDB info: ", tmdb_info, file=sys.stderr)
+        log.info("Queried TMDB info: %s", tmdb_info)
     else:
-        print("No TMDB info found by terms: ", terms, file=sys.stderr)
+        log.info("No TMDB info found by terms: %s", terms)
 
     rename_response = generate_rename_response(paths, tmdb_info, prompt)
     if not rename_response:
-        print("Failed to generate rename response.", file=sys.stderr)
+        log.error("Failed to generate rename response.")
         return None
 
     return normalize_rename_response(paths, rename_response)
 
 
 def fetch_paths_recursively(directory: str, max_depth: int=2) -> List[str]:
-    try:
-        entries: List[str] = []
-        with os.scandir(directory) as it:
-            for entry in it:
-                if entry.name.startswith('.') and entry.name not in ['.', '..']:
-                    continue
-
-                abs_path = os.path.abspath(entry.path)
-                entries.append(abs_path)
-    except PermissionError as e:
-        print(f"Permission denied: {e}", file=sys.stderr)
-        return []
-
-    entries.sort()
-
-    if has_video_files(entries):
-        return entries
-    else:
-        if max_depth <= 1:
-            return entries
+    all_entries: List[str] = []
+    # explicit stack, pushed in reverse so subdirectories are still visited in sorted order
+    stack: List[Tuple[str, int]] = [(os.path.abspath(directory), max_depth)]
+
+    while stack:
+        current, depth = stack.pop()
+        dir_entries: List[os.DirEntry[str]] = []
+        has_video = False
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+
+                    dir_entries.append(entry)
+                    # detect videos during the scan, on the short entry name rather than the full path
+                    has_video = has_video or _extension(entry.name) in VIDEO_EXTENSIONS
+        except PermissionError as e:
+            log.warning("Permission denied: %s", e)
+            continue
+
+        dir_entries.sort(key=lambda entry: entry.name)
+        entries = [entry.path for entry in dir_entries]
+        if has_video or depth <= 1:
+            all_entries.extend(entries)
         else:
-            all_entries: List[str] = []
-            for entry in entries:
-                if os.path.isdir(entry):
-                    all_entries.extend(fetch_paths_recursively(entry, max_depth - 1))
-            return all_entries
+            # DirEntry.is_dir() reuses the type scandir already returned instead of another stat
+            subdirs = [entry.path for entry in dir_entries if entry.is_dir()]
+            stack.extend((subdir, depth - 1) for subdir in reversed(subdirs))
+
+    return all_entries
 
 
 def main():
@@ -284,14 +545,21 @@ def main():
     parser.add_argument("--dry-run", "-d", default=False, action="store_true", help="Perform a dry run without making actual changes")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
     parser.add_argument("--no-require-subtitles", "-n", default=False, action="store_true", help="Do not require subtitle files")
+    parser.add_argument("--no-cache", default=False, action="store_true", help="Ignore cached TMDB results and rename plans and refresh them")
+    parser.add_argument("--serial", default=False, action="store_true", help="Rename files one at a time instead of in parallel")
     parser.add_argument("directories", type=str, nargs="*", default=None, help="Target directories")
     args = parser.parse_args()
 
-    load_dotenv()
+    logging.basicConfig(format="%(message)s")
+    log.setLevel(logging.DEBUG if args.debug else logging.INFO)
+    # per-attempt retry warnings are noise; the final failure is logged by the caller
+    if not args.debug:
+        logging.getLogger("urllib3").setLevel(logging.ERROR)
 
     if not args.directories:
-        path_str = sys.stdin.read()
-        paths = filter_hidden_paths(path_str.strip().split('\n'))
+        # overlap connection setup with reading stdin
+        _warm_up_connections()
+        paths = filter_hidden_paths(line.rstrip('\n') for line in sys.stdin)
     else:
         paths: List[str] = []
         for dir in args.directories:
@@ -299,13 +567,13 @@ def main():
                 paths.extend(fetch_paths_recursively(dir))
 
     if not paths:
-        print("No valid paths provided.", file=sys.stderr)
+        log.error("No valid paths provided.")
         sys.exit(1)
 
     if not args.no_require_subtitles and not args.dry_run:
         if not has_subtitle_files(paths):
-            print("No subtitle files found. Skipping rename process.", file=sys.stderr)
-            print("Use --no-require-subtitles to disable this check.", file=sys.stderr)
+            log.error("No subtitle files found. Skipping rename process.")
+            log.error("Use --no-require-subtitles to disable this check.")
             sys.exit(1)
 
     if not args.terms:
@@ -314,32 +582,37 @@ def main():
     else:
         anime_name = args.terms
 
-    rename_plan = generate_rename_plan(anime_name, paths)
+    rename_plan = generate_rename_plan(anime_name, paths, use_cache=not args.no_cache)
     if not rename_plan:
-        print("Failed to generate rename plan.", file=sys.stderr)
+        log.error("Failed to generate rename plan.")
         sys.exit(1)
 
     if args.debug:
-        print("Paths to be renamed:", file=sys.stderr)
+        log.debug("Paths to be renamed:")
         for p in paths:
-            print(f"  {p}", file=sys.stderr)
+            log.debug("  %s", p)
 
-        print("Generated rename plan:", file=sys.stderr)
-        print(json.dumps(rename_plan, indent=2, ensure_ascii=False), file=sys.stderr)
+        log.debug("Generated rename plan:")
+        log.debug("%s", _json_dumps(rename_plan, indent=True).decode())
 
     diff_rename_files(rename_plan)
     if args.directories:
         confirm = input("Proceed with the renaming? (y/N): ")
         if confirm.lower() != 'y':
-            print("Aborting rename operation.", file=sys.stderr)
+            log.info("Aborting rename operation.")
             sys.exit(0)
 
     output_name = f".{anime_name}.rename-plan.json" if anime_name else ".rename-plan.json"
-    with open(os.path.join(os.getcwd(), output_name), "w") as f:
-        json.dump(rename_plan, f, indent=2, ensure_ascii=False)
+    with open(os.path.join(os.getcwd(), output_name), "wb") as f:
+        f.write(_json_dumps(rename_plan, indent=True))
 
-    if not args.dry_run:
-        execute_rename_plan(rename_plan)
+    if args.dry_run:
+        # the real run that usually follows picks the plan up from the cache
+        save_rename_plan(anime_name, paths, rename_plan)
+    else:
+        execute_rename_plan(rename_plan, max_workers=1 if args.serial else RENAME_WORKERS)
+        # a dry run may have cached this plan; its inputs are gone now, so it can never be hit again
+        discard_rename_plan(anime_name, paths)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,27 @@
+import io
+import json
 import os
 import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 try:
+    from bt_rename import rename
     from bt_rename.rename import (
+        common_top_directory,
+        extract_anime_name,
         fetch_paths_recursively,
+        filter_hidden_paths,
+        has_subtitle_files,
+        has_video_files,
+        normalize_rename_response,
     )
 except ImportError as e:
     print(f"Import error: {e}")
@@ -31,4 +47,413 @@ class TestFetchPathsRecursively:
         assert set(paths) == {
             os.path.join(DIR2_PATH, 'Season 1', 'SPs'),
             os.path.join(DIR2_PATH, 'Season 2', 'S02E01.mkv'),
-        }
\ No newline at end of file
+        }
+
+
+class TestExtractAnimeName:
+    def test_strip_tags(self):
+        name = extract_anime_name('[VCB-Studio] GIRLS und PANZER [Ma10p_1080p] (BDRip)')
+        assert name == 'GIRLS und PANZER'
+
+    def test_collapse_spaces(self):
+        assert extract_anime_name('  Girls   und [x]  Panzer ') == 'Girls und Panzer'
+
+
+class TestFilterHiddenPaths:
+    def test_filter_hidden_components(self):
+        paths = [
+            'Show/S01E01.mkv',
+            'Show/.DS_Store',
+            '.Show/S01E01.mkv',
+            'Show/..hidden/S01E01.mkv',
+            '',
+            '   ',
+        ]
+        assert filter_hidden_paths(paths) == ['Show/S01E01.mkv']
+
+    def test_keep_relative_components(self):
+        paths = ['./Show/S01E01.mkv', '../Show/S01E01.mkv', 'Show/./S01E01.mkv', 'Show/..']
+        assert filter_hidden_paths(paths) == paths
+
+
+class TestCommonTopDirectory:
+    def test_single_root(self):
+        paths = ['Show/S01E01.mkv', 'Show/Season 2/S02E01.mkv', 'Show/SPs']
+        assert common_top_directory(paths) == 'Show'
+
+    def test_diverging_roots(self):
+        assert common_top_directory(['Show A/S01E01.mkv', 'Show B/S01E01.mkv']) == ''
+
+    def test_absolute_paths(self):
+        assert common_top_directory(['/data/Show/S01E01.mkv', '/data/Show/SPs']) == ''
+
+
+class TestNormalizeRenameResponse:
+    def test_fenced_json(self):
+        response = '```json\n{"result": ["Show/Season 1/S01E01.mkv", "Show/Season 1/SPs"]}\n```'
+        assert normalize_rename_response(['a.mkv', 'SPs'], response) == {
+            'a.mkv': 'Show/Season 1/S01E01.mkv',
+            'SPs': 'Show/Season 1/SPs',
+        }
+
+    def test_length_mismatch(self):
+        assert normalize_rename_response(['a.mkv', 'b.mkv'], '{"result": ["x.mkv"]}') is None
+
+
+class TestMediaExtensions:
+    def test_has_video_files(self):
+        assert has_video_files(['Show/S01E01.MKV'])
+        assert not has_video_files(['Show/S01E01.ass', 'Show/mkv', 'Show.mkv/readme'])
+
+    def test_has_subtitle_files(self):
+        assert has_subtitle_files(['Show/S01E01.mkv', 'Show/S01E01.sc.Ass'])
+        assert not has_subtitle_files(['Show/S01E01.mkv', 'Show/ass'])
+
+
+class _CountingHandler(BaseHTTPRequestHandler):
+    # class attributes are set per test via type(); records how many POSTs reached the server
+    posts = 0
+    statuses: list = []
+    delay = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        type(self).posts += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        time.sleep(self.delay)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestOpenRouterRetry:
+    def _post(self, handler, timeout=5.0):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        # same retry policy as the real session, mounted for plain http on the local server
+        retry = rename._OPENROUTER_SESSION.get_adapter('https://openrouter.ai/').max_retries
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(max_retries=retry))
+        try:
+            return session.post(f'http://127.0.0.1:{server.server_port}/', json={}, timeout=timeout, stream=True)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_read_timeout_not_retried(self):
+        handler = type('Handler', (_CountingHandler,), {'posts': 0, 'statuses': [], 'delay': 1.0})
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            self._post(handler, timeout=0.3)
+        assert handler.posts == 1
+
+    def test_rate_limit_retried(self):
+        handler = type('Handler', (_CountingHandler,), {'posts': 0, 'statuses': [429], 'delay': 0.0})
+        response = self._post(handler)
+        assert response.status_code == 200
+        assert handler.posts == 2
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(rename, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setenv('TMDB_API_KEY', 'tmdb-key')
+    monkeypatch.setenv('OPENROUTER_API_KEY', 'openrouter-key')
+    for cached in (rename._env, rename._search_tmdb_best_match, rename._fetch_tmdb_details):
+        cached.cache_clear()
+    yield tmp_path
+    for cached in (rename._env, rename._search_tmdb_best_match, rename._fetch_tmdb_details):
+        cached.cache_clear()
+
+
+class TestCacheFiles:
+    def test_round_trip(self, cache_dir):
+        rename._write_cache(os.path.join('plans', 'a.json'), {'k': 'v'})
+        assert rename._read_cache(os.path.join('plans', 'a.json')) == {'k': 'v'}
+        assert os.listdir(cache_dir / 'plans') == ['a.json']
+
+    def test_missing_file(self, cache_dir):
+        assert rename._read_cache('tmdb.json') == {}
+
+    def test_non_object_json(self, cache_dir):
+        (cache_dir / 'tmdb.json').write_text('[]')
+        assert rename._read_cache('tmdb.json') == {}
+
+    def test_invalid_utf8_without_orjson(self, cache_dir, monkeypatch):
+        monkeypatch.setattr(rename, 'orjson', None)
+        (cache_dir / 'tmdb.json').write_bytes(b'{"\xff": 1}')
+        assert rename._read_cache('tmdb.json') == {}
+
+
+def _clear_tmdb_memo():
+    rename._search_tmdb_best_match.cache_clear()
+    rename._fetch_tmdb_details.cache_clear()
+
+
+@pytest.fixture
+def tmdb_get(mocker):
+    def get(url, params=None, timeout=None):
+        if url.endswith('/search/tv'):
+            body = {'results': [{'id': 42}]}
+        elif url.endswith('/search/movie'):
+            body = {'results': []}
+        else:
+            body = {'name': 'Show', 'url': url}
+        return mocker.Mock(content=json.dumps(body).encode(), raise_for_status=lambda: None)
+
+    return mocker.patch.object(rename._TMDB_SESSION, 'get', side_effect=get)
+
+
+def _called_urls(mock_get):
+    # the movie search races a TV hit and may or may not have been sent yet, so leave it out
+    return sorted(call.args[0] for call in mock_get.call_args_list if not call.args[0].endswith('/search/movie'))
+
+
+class TestQueryTmdbCache:
+    DETAILS = ('TV', {'name': 'Show', 'url': 'https://api.themoviedb.org/3/tv/42'})
+
+    def test_miss_then_hit(self, cache_dir, tmdb_get):
+        assert rename.query_tmdb('Show') == self.DETAILS
+        assert _called_urls(tmdb_get) == [
+            'https://api.themoviedb.org/3/search/tv',
+            'https://api.themoviedb.org/3/tv/42',
+        ]
+
+        _clear_tmdb_memo()
+        tmdb_get.reset_mock()
+        assert rename.query_tmdb('Show') == self.DETAILS
+        assert _called_urls(tmdb_get) == []
+
+    def test_expired_entries_refetched(self, cache_dir, tmdb_get, monkeypatch):
+        rename.query_tmdb('Show')
+        _clear_tmdb_memo()
+        tmdb_get.reset_mock()
+
+        now = time.time()
+        monkeypatch.setattr(rename.time, 'time', lambda: now + rename.TMDB_CACHE_TTL + 1)
+        assert rename.query_tmdb('Show') == self.DETAILS
+        assert _called_urls(tmdb_get) == [
+            'https://api.themoviedb.org/3/search/tv',
+            'https://api.themoviedb.org/3/tv/42',
+        ]
+
+    def test_details_shared_across_titles(self, cache_dir, tmdb_get):
+        rename.query_tmdb('Show')
+        _clear_tmdb_memo()
+        tmdb_get.reset_mock()
+
+        assert rename.query_tmdb('Show Season 1') == self.DETAILS
+        assert _called_urls(tmdb_get) == ['https://api.themoviedb.org/3/search/tv']
+
+    def test_cache_file_untouched_on_full_hit(self, cache_dir, tmdb_get):
+        rename.query_tmdb('Show')
+        cache_file = cache_dir / 'tmdb.json'
+        os.utime(cache_file, ns=(0, 0))
+        content = cache_file.read_bytes()
+
+        _clear_tmdb_memo()
+        rename.query_tmdb('Show')
+        assert cache_file.stat().st_mtime_ns == 0
+        assert cache_file.read_bytes() == content
+
+    def test_use_cache_false_refetches(self, cache_dir, tmdb_get):
+        rename.query_tmdb('Show')
+        _clear_tmdb_memo()
+        tmdb_get.reset_mock()
+
+        assert rename.query_tmdb('Show', use_cache=False) == self.DETAILS
+        assert _called_urls(tmdb_get) == [
+            'https://api.themoviedb.org/3/search/tv',
+            'https://api.themoviedb.org/3/tv/42',
+        ]
+
+    def test_malformed_cache_file_ignored(self, cache_dir, tmdb_get):
+        (cache_dir / 'tmdb.json').write_text('{"search:Show:zh-CN": [], "tv/42:zh-CN": {"ts": "x"}}')
+        assert rename.query_tmdb('Show') == self.DETAILS
+
+    @pytest.mark.parametrize('search, details', [
+        ({}, {}),
+        ({'media_type': 1, 'id': 42}, {'details': []}),
+        ({'media_type': 'SHOW', 'id': 42}, {}),
+        ({'media_type': 'TV', 'id': '42'}, {}),
+        ({'media_type': 'TV', 'id': 42}, {'details': None}),
+    ])
+    def test_incomplete_entries_ignored(self, cache_dir, tmdb_get, search, details):
+        now = time.time()
+        cache = {'search:Show:zh-CN': {'ts': now, **search}, 'tv/42:zh-CN': {'ts': now, **details}}
+        (cache_dir / 'tmdb.json').write_text(json.dumps(cache))
+
+        assert rename.query_tmdb('Show') == self.DETAILS
+        cached = rename._read_cache('tmdb.json')
+        assert cached['search:Show:zh-CN']['media_type'] == 'TV'
+        assert cached['tv/42:zh-CN']['details'] == self.DETAILS[1]
+
+
+class TestRenamePlanCache:
+    @pytest.fixture
+    def media(self, cache_dir, mocker):
+        media_dir = cache_dir / 'media'
+        media_dir.mkdir()
+        paths = []
+        for name in ('a.mkv', 'a.ass'):
+            (media_dir / name).touch()
+            paths.append(str(media_dir / name))
+        mocker.patch.object(rename, 'query_tmdb', return_value=None)
+        response = json.dumps({'result': [f'Show/Season 1/{os.path.basename(p)}' for p in paths]})
+        generate = mocker.patch.object(rename, 'generate_rename_response', return_value=response)
+        return paths, generate
+
+    def test_unsaved_plan_not_reused(self, media):
+        paths, generate = media
+        rename.generate_rename_plan('Show', paths)
+        rename.generate_rename_plan('Show', paths)
+        assert generate.call_count == 2
+
+    def test_cache_hit(self, media):
+        paths, generate = media
+        plan = rename.generate_rename_plan('Show', paths)
+        rename.save_rename_plan('Show', paths, plan)
+        generate.reset_mock()
+
+        assert rename.generate_rename_plan('Show', paths) == plan
+        generate.assert_not_called()
+
+    def test_newer_input_invalidates(self, media):
+        paths, generate = media
+        rename.save_rename_plan('Show', paths, rename.generate_rename_plan('Show', paths))
+        future = time.time() + 60
+        os.utime(paths[0], (future, future))
+        generate.reset_mock()
+
+        rename.generate_rename_plan('Show', paths)
+        generate.assert_called_once()
+
+    def test_key_mismatch_ignored(self, media):
+        paths, generate = media
+        rename.save_rename_plan('Show', paths, {paths[0]: 'Show/Season 1/a.mkv'})
+        generate.reset_mock()
+
+        assert set(rename.generate_rename_plan('Show', paths)) == set(paths)
+        generate.assert_called_once()
+
+    def test_use_cache_false(self, media):
+        paths, generate = media
+        rename.save_rename_plan('Show', paths, rename.generate_rename_plan('Show', paths))
+        generate.reset_mock()
+
+        rename.generate_rename_plan('Show', paths, use_cache=False)
+        generate.assert_called_once()
+
+    def test_save_prunes_expired_plans(self, media):
+        paths, _ = media
+        rename.save_rename_plan('Old', paths, {})
+        rename.save_rename_plan('Recent', paths, {})
+        expired = time.time() - rename.TMDB_CACHE_TTL - 60
+        os.utime(os.path.join(rename.CACHE_DIR, rename._plan_cache_name('Old', paths)), (expired, expired))
+
+        rename.save_rename_plan('Show', paths, {})
+        assert sorted(os.listdir(os.path.join(rename.CACHE_DIR, 'plans'))) == sorted(
+            os.path.basename(rename._plan_cache_name(terms, paths)) for terms in ('Recent', 'Show'))
+
+    def _run_main(self, monkeypatch, paths, *args):
+        monkeypatch.setattr(rename, '_warm_up_connections', lambda: None)
+        monkeypatch.setattr(sys, 'argv', ['bt-rename', '--terms', 'Show', *args])
+        monkeypatch.setattr(sys, 'stdin', io.StringIO(''.join(f'{p}\n' for p in paths)))
+        rename.main()
+
+    def test_main_caches_dry_run_and_discards_after_rename(self, media, monkeypatch, tmp_path):
+        paths, generate = media
+        monkeypatch.chdir(tmp_path)
+        plans_dir = os.path.join(rename.CACHE_DIR, 'plans')
+
+        self._run_main(monkeypatch, paths, '--dry-run')
+        assert len(os.listdir(plans_dir)) == 1
+        generate.reset_mock()
+
+        self._run_main(monkeypatch, paths)
+        generate.assert_not_called()
+        assert (tmp_path / 'Show' / 'Season 1' / 'a.mkv').exists()
+        assert os.listdir(plans_dir) == []
+
+    def test_main_does_not_cache_executed_plan(self, media, monkeypatch, tmp_path):
+        paths, _ = media
+        monkeypatch.chdir(tmp_path)
+
+        self._run_main(monkeypatch, paths)
+        assert not os.path.exists(os.path.join(rename.CACHE_DIR, 'plans'))
+
+
+class _FakeStream:
+    def __init__(self, *lines):
+        self.lines = lines
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+
+def _delta(content):
+    return b'data: ' + json.dumps({'choices': [{'delta': {'content': content}}]}).encode()
+
+
+class TestReadCompletionStream:
+    def test_joins_content_deltas(self):
+        response = _FakeStream(b': OPENROUTER PROCESSING', _delta('{"result": '), b'',
+                               b': keep-alive', _delta('[]}'), b'data: [DONE]', _delta('ignored'))
+        assert rename._read_completion_stream(response) == '{"result": []}'
+
+    def test_data_without_space(self):
+        response = _FakeStream(_delta('a').replace(b'data: ', b'data:'), b'data:[DONE]')
+        assert rename._read_completion_stream(response) == 'a'
+
+    def test_error_chunk(self, caplog):
+        response = _FakeStream(_delta('a'), b'data: {"error": {"message": "overloaded"}}', b'data: [DONE]')
+        assert rename._read_completion_stream(response) is None
+        assert 'overloaded' in caplog.text
+
+    def test_malformed_chunk(self, caplog):
+        response = _FakeStream(_delta('a'), b'data: {"choices": [', b'data: [DONE]')
+        assert rename._read_completion_stream(response) is None
+        assert 'Failed to parse stream chunk' in caplog.text
+
+    def test_invalid_utf8_without_orjson(self, monkeypatch, caplog):
+        monkeypatch.setattr(rename, 'orjson', None)
+        response = _FakeStream(_delta('a'), b'data: {"choices": "\xff"}', b'data: [DONE]')
+        assert rename._read_completion_stream(response) is None
+        assert 'Invalid UTF-8' in caplog.text
+
+
+class TestExecuteRenamePlan:
+    @pytest.fixture
+    def media(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / 'Show').mkdir()
+        for name in ('a.mkv', 'a.ass', 'b.mkv'):
+            (tmp_path / 'Show' / name).write_text(name)
+        return {
+            os.path.join('Show', 'a.mkv'): os.path.join('New', 'Season 1', 'S01E01.mkv'),
+            os.path.join('Show', 'a.ass'): os.path.join('New', 'Season 1', 'S01E01.ass'),
+            os.path.join('Show', 'b.mkv'): os.path.join('New', 'SPs', 'SP01.mkv'),
+        }
+
+    def _assert_moved(self, tmp_path, rename_map):
+        for original, new in rename_map.items():
+            assert not (tmp_path / original).exists()
+            assert (tmp_path / new).read_text() == os.path.basename(original)
+
+    def test_renames_and_creates_directories(self, tmp_path, media):
+        rename.execute_rename_plan(media)
+        self._assert_moved(tmp_path, media)
+
+    def test_serial(self, tmp_path, media):
+        rename.execute_rename_plan(media, max_workers=1)
+        self._assert_moved(tmp_path, media)
+
+    def test_failure_logged_and_reraised(self, tmp_path, media, caplog):
+        missing = os.path.join('Show', 'missing.mkv')
+        with pytest.raises(FileNotFoundError):
+            rename.execute_rename_plan({**media, missing: os.path.join('New', 'missing.mkv')})
+
+        assert f"Failed to rename '{tmp_path / missing}'" in caplog.text
+        self._assert_moved(tmp_path, media)